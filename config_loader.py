@@ -14,8 +14,18 @@
 # ===============================================================
 
 import os
-import json
+import re
+import functools
+import settings
 from settings import Logs, model, enable_memory
+from core.io_utils import dumps
+from core.user_state import get_logs, get_summary
+
+# prompt.txt is re-read only when its mtime changes
+_PROMPT_CACHE = {"path": "prompt.txt", "mtime": 0, "text": None}
+
+# Template placeholders filled by load_ai_prompt
+_PLACEHOLDER_RE = re.compile(r"\{(context|summary|prompt)\}")
 
 # ================================
 #  Configuration Loading Functions
@@ -23,6 +33,7 @@ from settings import Logs, model, enable_memory
 
 # ==== Load model from settings.py ====
 
+@functools.lru_cache(maxsize=1)
 def load_model_from_settings():
     """Load model name from imported settings.py"""
     try:
@@ -49,10 +60,8 @@ def load_telegram_token():
         return ""
 
 # ==== Load AI prompt template ====
-def load_ai_prompt(user_id):
-    folder = os.path.join("logs", str(user_id))
-    summary_path = os.path.join(folder, "summary.json")
-    log_path = os.path.join(folder, "user.json")
+def load_ai_prompt(user_id, user_prompt):
+    """Build the full model prompt for a user's message"""
     default_prompt=(
       "You are Blimsey, a playful virtual companion inspired by Tamagotchi and Pokemon.\n"
       "You live and grow inside a digital world and evolve by interacting with your human.\n"
@@ -80,10 +89,14 @@ def load_ai_prompt(user_id):
       "User instruction: {prompt}\n\n"
       "Now respond as Blimsey-make it fun, a little dramatic, and unforgettable!"
     )
-    # Get prompt.txt
+    # Get prompt.txt (cached until the file changes)
     try:
-      with open("prompt.txt", "r", encoding="utf-8") as f:
-          base_prompt = f.read().strip()
+      mtime = os.stat(_PROMPT_CACHE["path"]).st_mtime_ns
+      if _PROMPT_CACHE["text"] is None or _PROMPT_CACHE["mtime"] != mtime:
+          with open(_PROMPT_CACHE["path"], "r", encoding="utf-8") as f:
+              _PROMPT_CACHE["text"] = f.read().strip()
+          _PROMPT_CACHE["mtime"] = mtime
+      base_prompt = _PROMPT_CACHE["text"]
       if not base_prompt:
           print("WARNING: prompt.txt is empty. Using default prompt.")
           base_prompt = default_prompt
@@ -94,65 +107,74 @@ def load_ai_prompt(user_id):
 
     # Read summary (if exist)
     summary_text = ""
-    if os.path.exists(summary_path):
+    summary_data = get_summary(user_id)
+    if summary_data is not None:
         try:
-            with open(summary_path, "r", encoding="utf-8") as f:
-                summary_data = json.load(f)
-            summary_text = "\n\n{user_summary:\n" + json.dumps(summary_data, ensure_ascii=False, indent=2) + "\n}"
+            summary_text = "\n\n{user_summary:\n" + dumps(summary_data, pretty=True) + "\n}"
         except:
             pass
 
-    # Read last 5 interactions (if exist)
+    # Read last interactions (if exist)
     context_text = ""
-    if os.path.exists(log_path):
+    logs = get_logs(user_id)[-int(Logs):]
+    if logs:
         try:
-            with open(log_path, "r", encoding="utf-8") as f:
-                logs = json.load(f)[-Logs:]
-            blocks = [
-                f"User: {entry.get('message', '').strip()}\nAssistant: {entry.get('response', '').strip()}"
+            # Entries are stripped when logged, so this is a single join
+            context_text = "\n\n{recent_interactions:\n" + "\n---\n".join(
+                f"User: {entry.get('message', '')}\nAssistant: {entry.get('response', '')}"
                 for entry in logs
-            ]
-            context_text = "\n\n{recent_interactions:\n" + "\n---\n".join(blocks) + "\n}"
+            ) + "\n}"
         except:
             pass
 
-    # Integration
-    full_prompt = f"{base_prompt}{summary_text}{context_text}"
+    # Integration: fill {context}/{summary}/{prompt} in one pass and
+    # append whatever the template does not reference
+    values = {
+        "context": context_text.lstrip("\n"),
+        "summary": summary_text.lstrip("\n"),
+        "prompt": user_prompt
+    }
+    used = set(_PLACEHOLDER_RE.findall(base_prompt))
+    full_prompt = _PLACEHOLDER_RE.sub(lambda m: values[m.group(1)], base_prompt)
+    if "summary" not in used:
+        full_prompt += summary_text
+    if "context" not in used:
+        full_prompt += context_text
+    if "prompt" not in used:
+        full_prompt += f"\n\nUser instruction: {user_prompt}"
     return full_prompt
 
 # ==== Whitelist ====
 def load_whitelist():
     """Load whitelist flag from settings.py and user IDs from whitelist.txt"""
-    whitelist = False
+    whitelist = bool(getattr(settings, 'whitelist', False))
     user_whitelist = set()
 
-    # Read whitelist flag from settings.py
-    try:
-        if os.path.exists('settings.py'):
-            with open('settings.py', 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line.lower().startswith('whitelist ='):
-                        value = line.split('=')[1].strip().lower()
-                        whitelist = value == 'true'
-                        break
-    except Exception as e:
-        print(f"ERROR reading whitelist flag from settings.py: {e}")
-
-    # Read user IDs from whitelist.txt
+    # Read user IDs from whitelist.txt in one read
     try:
-        if os.path.exists('whitelist.txt'):
-            with open('whitelist.txt', 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and line.isdigit():
-                        user_whitelist.add(int(line))
+        with open('whitelist.txt', 'r', encoding='utf-8') as f:
+            user_whitelist = {int(token) for token in f.read().split() if token.isdigit()}
+    except FileNotFoundError:
+        pass
     except Exception as e:
         print(f"ERROR reading user IDs from whitelist.txt: {e}")
 
-    return whitelist, user_whitelist
+    return whitelist, frozenset(user_whitelist)
+
+WHITELIST, USER_WHITELIST = load_whitelist()
+
+def reload_whitelist():
+    """Re-read whitelist.txt and swap in the new ID set atomically"""
+    global WHITELIST, USER_WHITELIST
+    WHITELIST, USER_WHITELIST = load_whitelist()
+    return USER_WHITELIST
+
+def is_authorized(user_id):
+    """Return True if the user may talk to the bot"""
+    return not WHITELIST or int(user_id) in USER_WHITELIST
 
 # ==== Keywords list ====
+@functools.lru_cache(maxsize=1)
 def load_keyword_phrases():
     """Load keyword phrases from keywordPhrases.txt file (customizable, no defaults)"""
     keywords = []
@@ -168,18 +190,27 @@ def load_keyword_phrases():
     return keywords
 
 # ==== ChromaDB Client Loader ====
-import chromadb
-from settings import enable_memory
-
 def load_chroma_client():
-    """Initialize ChromaDB client if memory is enabled"""
+    """Initialize the shared ChromaDB client if memory is enabled"""
     if enable_memory:
         try:
-            client = chromadb.Client(
-                settings=chromadb.config.Settings(
-                    persist_directory="./chroma_memoria"
+            import chromadb
+            chroma_host = getattr(settings, 'chroma_host', None)
+            if chroma_host:
+                # Remote Chroma server; one HTTP client reused by every thread
+                client = chromadb.HttpClient(
+                    host=chroma_host,
+                    port=int(getattr(settings, 'chroma_port', 8000))
+                )
+            else:
+                # PersistentClient honours the path; Client() would stay in memory
+                client = chromadb.PersistentClient(
+                    path="./chroma_memoria",
+                    settings=chromadb.config.Settings(
+                        anonymized_telemetry=False,
+                        allow_reset=False
+                    )
                 )
-            )
             print("[Memory] ChromaDB memory system ENABLED.")
             return client
         except Exception as e:
@@ -187,4 +218,10 @@ def load_chroma_client():
             return None
     else:
         print("[Memory] ChromaDB memory system DISABLED in settings.py.")
-        return None
\ No newline at end of file
+        return None
+
+# ================================
+#  Shared Configuration
+# ================================
+MODEL_NAME = load_model_from_settings()
+CHROMA_CLIENT = load_chroma_client()
@@ -13,23 +13,33 @@
 import time
 import traceback
 import re
-import ollama
 
-from config_loader import load_model_from_settings, load_ai_prompt
-from memory_manager import (
-    load_chroma_client,
-    get_user_memory,
-    store_in_memory
-)
+from config_loader import MODEL_NAME, CHROMA_CLIENT, load_ai_prompt
+from memory_manager import get_user_memory, store_in_memory
 from core.logger import log_user_interaction
+from core.ollama_client import get_ollama
 from core.summary_manager import update_user_summary
 
 # ================================
 #  Configuration
 # ================================
-MODEL_NAME = load_model_from_settings()
 MAX_RESPONSE_LENGTH = 4000
-client = load_chroma_client()
+# Raw output is streamed up to this size; the headroom covers any
+# reasoning preamble that extract_final_response strips off
+MAX_GENERATION_LENGTH = 2 * MAX_RESPONSE_LENGTH
+TRUNCATION_NOTICE = "\n\n[Response truncated due to length limit]"
+
+_EXTRACT_PATTERNS = [
+    re.compile(p, re.IGNORECASE | re.DOTALL) for p in (
+        r"(?:Responde|Response|Final response|Respuesta final):\s*(.*?)$",
+        r"<respuesta>(.*?)</respuesta>",
+        r"<response>(.*?)</response>",
+        r"(?:^|\n)(?:Mi respuesta es|La respuesta es|Respuesta):\s*(.*?)$"
+    )
+]
+# Every extract pattern contains one of these; skip the regexes otherwise
+_CHEAP_TOKENS = ('respon', 'respuesta')
+_INDICATORS = ('thinking:', 'let me think', 'i need to', 'first,', 'hmm,', 'well,', 'so,')
 
 # ================================
 #  Function Definitions
@@ -37,38 +47,55 @@ client = load_chroma_client()
 
 def extract_final_response(full_response):
     """Extract only the final response from the model output"""
-    patterns = [
-        r"(?:Responde|Response|Final response|Respuesta final):\s*(.*?)$",
-        r"<respuesta>(.*?)</respuesta>",
-        r"<response>(.*?)</response>",
-        r"(?:^|\n)(?:Mi respuesta es|La respuesta es|Respuesta):\s*(.*?)$"
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, full_response, re.IGNORECASE | re.DOTALL)
-        if match:
-            return match.group(1).strip()
+    lower_full = full_response.lower()
+    if any(tok in lower_full for tok in _CHEAP_TOKENS):
+        for pattern in _EXTRACT_PATTERNS:
+            match = pattern.search(full_response)
+            if match:
+                return match.group(1).strip()
 
     lines = full_response.split('\n')
-    indicators = ['thinking:', 'let me think', 'i need to', 'first,', 'hmm,', 'well,', 'so,']
-    response_lines = [l.strip() for l in lines if not any(ind in l.lower() for ind in indicators)]
+    if any(ind in lower_full for ind in _INDICATORS):
+        response_lines = [l.strip() for l in lines if not any(ind in l.lower() for ind in _INDICATORS)]
+    else:
+        response_lines = [l.strip() for l in lines]
     if response_lines:
         return '\n'.join(response_lines[-3:]).strip()
     return full_response.strip()
 
 
+def stream_generate(prompt):
+    """Stream a completion, stopping once MAX_GENERATION_LENGTH characters arrive"""
+    chunks = []
+    total = 0
+    stream = get_ollama().generate(model=MODEL_NAME, prompt=prompt, stream=True)
+    try:
+        for chunk in stream:
+            text = chunk['response']
+            chunks.append(text)
+            total += len(text)
+            if total >= MAX_GENERATION_LENGTH:
+                break
+    finally:
+        # Closing the stream drops the connection so Ollama stops generating
+        stream.close()
+    return ''.join(chunks), total >= MAX_GENERATION_LENGTH
+
+
 def generate_response(user_id, prompt):
     """Generate AI response using Ollama"""
-    memory = get_user_memory(user_id, client)
-    base_prompt = load_ai_prompt(user_id)
-    full_prompt = f"{base_prompt}\n\nUser instruction: {prompt}"
+    memory = get_user_memory(user_id, CHROMA_CLIENT)
+    full_prompt = load_ai_prompt(user_id, prompt)
     try:
         print(f"[{user_id}] Calling Ollama model '{MODEL_NAME}'...")
-        start_time = time.time()
-        full_response = ollama.generate(model=MODEL_NAME, prompt=full_prompt)['response']
-        duration = time.time() - start_time
+        start_time = time.monotonic()
+        full_response, cut_off = stream_generate(full_prompt)
+        duration = time.monotonic() - start_time
         response = extract_final_response(full_response)
         if len(response) > MAX_RESPONSE_LENGTH:
-            response = response[:MAX_RESPONSE_LENGTH] + "\n\n[Response truncated due to length limit]"
+            response = response[:MAX_RESPONSE_LENGTH] + TRUNCATION_NOTICE
+        elif cut_off:
+            response += TRUNCATION_NOTICE
         print(f"[{user_id}] Response received in {duration:.2f} seconds.")
         store_in_memory(memory, prompt, response, MODEL_NAME, user_id)
         log_user_interaction(user_id, prompt, response)
@@ -0,0 +1,93 @@
+# ===============================================================
+#  File: io_utils.py
+#  Description: JSON encode/decode helpers for Blimsey. Uses orjson
+#               when installed, falling back to the stdlib json module.
+#
+#  Author: ac.craft8
+#  Created: 2025-06-24
+#  License: MIT
+# ===============================================================
+
+# ================================
+#  Module and Library Imports
+# ================================
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError
+JSONDecodeError = json.JSONDecodeError
+
+# ================================
+#  Function Definitions
+# ================================
+
+def _dumps_bytes(obj, pretty=False):
+    """Serialize obj to UTF-8 encoded JSON bytes"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def dumps(obj, pretty=False):
+    """Serialize obj to a JSON string, keeping non-ASCII characters"""
+    return _dumps_bytes(obj, pretty).decode('utf-8')
+
+
+def loads(data):
+    """Parse JSON from a str or bytes object"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def read_json(path):
+    """Read and parse a JSON file"""
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+def atomic_write_json(path, obj):
+    """Write compact JSON to a temp file, fsync it and rename it over path"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_dumps_bytes(obj))
+        f.flush()
+        # Make the data durable before the rename makes it visible
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def append_jsonl(path, objs, create=True):
+    """Append objs as JSON lines in one O_APPEND write (create=False: path must exist)"""
+    data = b"".join(_dumps_bytes(obj) + b"\n" for obj in objs)
+    if not data:
+        return
+    flags = os.O_WRONLY | os.O_APPEND | (os.O_CREAT if create else 0)
+    fd = os.open(path, flags, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def atomic_write_jsonl(path, objs):
+    """Write objs as JSON lines to a temp file, fsync it and rename it over path"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(b"".join(_dumps_bytes(obj) + b"\n" for obj in objs))
+        f.flush()
+        # Make the data durable before the rename makes it visible
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
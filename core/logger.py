@@ -10,11 +10,18 @@
 # ================================
 #  Module and Library Imports
 # ================================
-import json
 import logging
 import os
+from logging.handlers import RotatingFileHandler
 from datetime import datetime
 
+from core.user_state import append_log
+
+# ================================
+#  Configuration
+# ================================
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
 
 # ================================
 #  Function Definitions
@@ -28,13 +35,13 @@ def setup_logging():
         level=logging.INFO,
         format='%(asctime)s - %(message)s',
         handlers=[
-            logging.FileHandler('messages.log', encoding='utf-8'),
+            RotatingFileHandler('messages.log', maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'),
             logging.StreamHandler()
         ]
     )
 
     response_logger = logging.getLogger('responses')
-    handler = logging.FileHandler('responses.log', encoding='utf-8')
+    handler = RotatingFileHandler('responses.log', maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
     handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
     response_logger.addHandler(handler)
     response_logger.setLevel(logging.INFO)
@@ -42,25 +49,14 @@ def setup_logging():
 
 
 def log_user_interaction(user_id, message, response):
-    """Log user interaction to per-user JSON file"""
-    user_dir = os.path.join('logs', str(user_id))
-    os.makedirs(user_dir, exist_ok=True)
-    user_log = os.path.join(user_dir, 'user.json')
-
+    """Log user interaction to per-user JSONL file"""
     interaction = {
         'timestamp': datetime.now().isoformat(),
-        'message': message,
-        'response': response
+        'message': message.strip(),
+        'response': response.strip()
     }
 
     try:
-        if os.path.exists(user_log):
-            with open(user_log, 'r', encoding='utf-8') as f:
-                logs = json.load(f)
-        else:
-            logs = []
-        logs.append(interaction)
-        with open(user_log, 'w', encoding='utf-8') as f:
-            json.dump(logs, f, ensure_ascii=False, indent=2)
+        append_log(user_id, interaction)
     except Exception as e:
         print(f"ERROR logging user interaction for {user_id}: {e}")
@@ -0,0 +1,41 @@
+# ===============================================================
+#  File: ollama_client.py
+#  Description: Shared Ollama client for Blimsey
+#
+#  Author: ac.craft8
+#  Created: 2025-06-24
+#  License: MIT
+# ===============================================================
+
+# ================================
+#  Module and Library Imports
+# ================================
+import threading
+
+import settings
+
+# ================================
+#  Configuration
+# ================================
+OLLAMA_TIMEOUT_SECONDS = 600
+# None lets the client fall back to $OLLAMA_HOST / localhost:11434
+OLLAMA_HOST = getattr(settings, 'ollama_host', None)
+
+# One client (and HTTP keep-alive connection pool) shared by every
+# reply and summary thread, created on first use
+_client = None
+_client_lock = threading.Lock()
+
+# ================================
+#  Function Definitions
+# ================================
+
+def get_ollama():
+    """Return the shared Ollama client, importing ollama on first call"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import ollama
+                _client = ollama.Client(host=OLLAMA_HOST, timeout=OLLAMA_TIMEOUT_SECONDS)
+    return _client
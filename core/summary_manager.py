@@ -10,15 +10,54 @@
 # ================================
 #  Module and Library Imports
 # ================================
-import json
+import copy
 import os
+import queue
 import re
+import threading
 import traceback
 from datetime import datetime
 
-import ollama
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
-from config_loader import load_keyword_phrases, load_model_from_settings
+from config_loader import MODEL_NAME, load_keyword_phrases
+from core.io_utils import JSONDecodeError, loads
+from core.ollama_client import get_ollama
+from core.user_state import ensure_user_dir, get_summary, set_summary
+
+# ================================
+#  Precompiled Patterns
+# ================================
+# All personal-info cues folded into one alternation so a message is
+# scanned once instead of once per pattern
+_INFO_RE = re.compile('|'.join('(?:%s)' % p for p in (
+    r'\bme llamo \w+', r'\bmi nombre es \w+', r'\bsoy \w+',
+    r'\btrabajo en \w+', r'\bvivo en \w+', r'\btengo \d+',
+    r'\bmi .+ es \w+', r'\bestoy aprendiendo \w+',
+    r'\bme dedico a \w+', r'\bmi profesión es \w+',
+    r'\bmi edad es \d+', r'\btengo \d+ años'
+)))
+# Fact extractors run on the lowercased prompt. Each capture is a few
+# words that must end at a clause boundary (punctuation, end of text or
+# a conjunction), so "me llamo ana y trabajo en google" yields "ana" and
+# a prompt without a clean boundary does not match at all
+_CLAUSE_END = r'(?=\s*(?:[,.;:!?]|$)|\s+(?:y|e|pero|porque|que)\b)'
+_NAME_RE = re.compile(r'\b(?:mi nombre es|me llamo)\s+([a-záéíóúüñ]+(?:\s+[a-záéíóúüñ]+){0,2}?)' + _CLAUSE_END)
+_WORK_RE = re.compile(r'\b(?:trabajo en|mi trabajo es)\s+([a-záéíóúüñ]+(?:\s+[a-záéíóúüñ]+){0,3}?)' + _CLAUSE_END)
+_LIKE_RE = re.compile(r'\b(?:me gustan?|prefiero|amo)\s+([a-záéíóúüñ]+(?:\s+[a-záéíóúüñ]+){0,3}?)' + _CLAUSE_END)
+
+# Short prompts the regexes already understand skip the extraction call
+REGEX_ONLY_MAX_WORDS = 40
+SUMMARY_MAX_TOKENS = 256
+
+# Most recent important topics kept per user
+MAX_TOPICS = 10
+
+# Keyword matcher, rebuilt only when keywordPhrases.txt changes
+_KW_MATCHER = {"path": "keywordPhrases.txt", "mtime": None, "search": None}
 
 # ================================
 #  Function Definitions
@@ -26,18 +65,15 @@ from config_loader import load_keyword_phrases, load_model_from_settings
 
 def get_user_summary_path(user_id):
     """Return path to user's summary file"""
-    user_dir = os.path.join('logs', str(user_id))
-    os.makedirs(user_dir, exist_ok=True)
-    return os.path.join(user_dir, 'summary.json')
+    return os.path.join(ensure_user_dir(user_id), 'summary.json')
 
 
 def load_user_summary(user_id):
     """Load user summary JSON if present"""
-    path = get_user_summary_path(user_id)
     try:
-        if os.path.exists(path):
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+        cached = get_summary(user_id)
+        if cached is not None:
+            return copy.deepcopy(cached)
         return {
             'personal_info': {},
             'preferences': {},
@@ -54,104 +90,211 @@ def load_user_summary(user_id):
         }
 
 
+def _iter_json_candidates(text):
+    """Return each outermost balanced {...} block of text in one linear pass"""
+    open_positions = []
+    spans = []
+    in_string = False
+    escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            # Braces inside JSON strings do not count towards nesting
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            if open_positions:
+                in_string = True
+        elif ch == '{':
+            open_positions.append(i)
+        elif ch == '}' and open_positions:
+            start = open_positions.pop()
+            # The new block encloses any block closed since it opened;
+            # a stray '{' that never closes never hides what follows it
+            while spans and spans[-1][0] > start:
+                spans.pop()
+            spans.append((start, i + 1))
+    return [text[start:end] for start, end in spans]
+
+
+def _iter_flat(value):
+    """Yield items of value, flattening one level of nested lists"""
+    if isinstance(value, list):
+        for item in value:
+            if isinstance(item, list):
+                yield from item
+            else:
+                yield item
+    else:
+        yield value
+
+
+def _clean_values(values):
+    """Split, strip and deduplicate summary values, keeping first-seen order"""
+    result = []
+    seen = set()
+    for val in _iter_flat(values):
+        parts = val.split(',') if isinstance(val, str) else (str(val),)
+        for part in parts:
+            part = part.strip()
+            key = part.lower()
+            if part and key != "no se proporcionó" and key not in seen:
+                seen.add(key)
+                result.append(part)
+    return result
+
+
+def _add_topics(topics, new_topics):
+    """Append unseen topics in place, keep the last MAX_TOPICS; True if any added"""
+    seen = set(topics)
+    added = False
+    for topic in new_topics:
+        topic = topic.strip() if isinstance(topic, str) else ""
+        if topic and topic not in seen:
+            seen.add(topic)
+            topics.append(topic)
+            added = True
+    # Trim in place rather than rebinding a sliced copy
+    del topics[:-MAX_TOPICS]
+    return added
+
+
 def save_user_summary(user_id, summary):
     """Persist merged summary data to disk"""
-    path = get_user_summary_path(user_id)
     try:
         summary['last_updated'] = datetime.now().isoformat()
-        if os.path.exists(path):
-            with open(path, 'r', encoding='utf-8') as f:
-                existing = json.load(f)
+        cached = get_summary(user_id)
+        if cached is not None:
+            existing = copy.deepcopy(cached)
         else:
             existing = {
                 'personal_info': {},
                 'preferences': {},
                 'important_topics': [],
                 'contradictions': {},
-                'last_updated': datetime.now().isoformat()
+                'last_updated': summary['last_updated']
             }
 
-        def normalize_to_list(value):
-            if isinstance(value, list):
-                result = []
-                for item in value:
-                    if isinstance(item, list):
-                        result.extend(item)
-                    else:
-                        result.append(item)
-                return result
-            return [value]
-
-        def clean_values(values):
-            flat = normalize_to_list(values)
-            result = []
-            for val in flat:
-                if isinstance(val, str):
-                    result.extend([v.strip() for v in val.split(',')])
-                else:
-                    result.append(str(val).strip())
-            return sorted(set(v for v in result if v and v.lower() != "no se proporcionó"))
-
-        for key, value in summary.get('personal_info', {}).items():
-            new_vals = clean_values(value)
-            old_vals = clean_values(existing['personal_info'].get(key, []))
-            merged = sorted(set(old_vals + new_vals))
-            if merged:
-                existing['personal_info'][key] = merged[0] if len(merged) == 1 else merged
-
-        for key, value in summary.get('preferences', {}).items():
-            new_vals = clean_values(value)
-            old_vals = clean_values(existing['preferences'].get(key, []))
-            merged = sorted(set(old_vals + new_vals))
-            if merged:
-                existing['preferences'][key] = merged[0] if len(merged) == 1 else merged
-
-        new_topics = clean_values(summary.get('important_topics', []))
-        for topic in new_topics:
-            if topic and topic not in existing['important_topics']:
-                existing['important_topics'].append(topic)
-        existing['important_topics'] = existing['important_topics'][-10:]
+        for section in ('personal_info', 'preferences'):
+            stored = existing[section]
+            for key, value in summary.get(section, {}).items():
+                # Stored values are already clean; only the union needs deduplicating
+                merged = _clean_values([stored.get(key, []), value])
+                if merged:
+                    stored[key] = merged[0] if len(merged) == 1 else merged
+
+        _add_topics(existing['important_topics'], _clean_values(summary.get('important_topics', [])))
         existing['last_updated'] = summary['last_updated']
 
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(existing, f, ensure_ascii=False, indent=2)
+        set_summary(user_id, existing)
     except Exception as e:
         print(f"ERROR saving summary for user {user_id}: {e}")
 
 
+def get_keyword_matcher():
+    """Return a single-pass matcher for any keyword phrase"""
+    try:
+        mtime = os.stat(_KW_MATCHER["path"]).st_mtime_ns
+    except OSError:
+        mtime = 0
+    if _KW_MATCHER["search"] is None or _KW_MATCHER["mtime"] != mtime:
+        load_keyword_phrases.cache_clear()
+        keywords = load_keyword_phrases()
+        if not keywords:
+            search = lambda text: False
+        elif ahocorasick is not None:
+            automaton = ahocorasick.Automaton()
+            for kw in keywords:
+                automaton.add_word(kw, kw)
+            automaton.make_automaton()
+            search = lambda text: next(automaton.iter(text), None) is not None
+        else:
+            pattern = re.compile("|".join(map(re.escape, keywords)))
+            search = lambda text: pattern.search(text) is not None
+        _KW_MATCHER["mtime"] = mtime
+        _KW_MATCHER["search"] = search
+    return _KW_MATCHER["search"]
+
+
 def should_update_summary(prompt, response):
     """Return True if summary should be updated based on keywords"""
-    keywords = load_keyword_phrases()
     prompt_lower = prompt.lower()
 
-    for kw in keywords:
-        if kw in prompt_lower:
-            return True
-
-    patterns = [
-        r'\bme llamo \w+', r'\bmi nombre es \w+', r'\bsoy \w+',
-        r'\btrabajo en \w+', r'\bvivo en \w+', r'\btengo \d+',
-        r'\bmi .+ es \w+', r'\bestoy aprendiendo \w+',
-        r'\bme dedico a \w+', r'\bmi profesión es \w+',
-        r'\bmi edad es \d+', r'\btengo \d+ años'
-    ]
-    for pattern in patterns:
-        if re.search(pattern, prompt_lower):
-            return True
+    if get_keyword_matcher()(prompt_lower):
+        return True
+
+    if _INFO_RE.search(prompt_lower):
+        return True
 
     if len(prompt.split()) > 20:
         return True
     return False
 
 
-MODEL_NAME = load_model_from_settings()
+# Summary updates run on one background worker so replies are not
+# blocked by the extraction call
+_SUMMARY_QUEUE = queue.Queue()
+_pending_updates = {}
+_pending_lock = threading.Lock()
+
 
 def update_user_summary(user_id, prompt, response):
-    """Analyze conversation and update stored summary"""
+    """Queue a summary update for the background worker"""
     if not should_update_summary(prompt, response):
         print(f"[{user_id}] Summary update not needed - no important keywords detected")
         return
-
+    with _pending_lock:
+        if user_id in _pending_updates:
+            # Coalesce with the update already waiting for this user
+            _pending_updates[user_id].append((prompt, response))
+            print(f"[{user_id}] Summary update merged into pending request")
+            return
+        _pending_updates[user_id] = [(prompt, response)]
+    _SUMMARY_QUEUE.put(user_id)
+
+
+def _summary_worker():
+    """Process queued summary updates one at a time"""
+    while True:
+        user_id = _SUMMARY_QUEUE.get()
+        try:
+            with _pending_lock:
+                items = _pending_updates.pop(user_id, [])
+            if items:
+                prompt = "\n".join(p for p, _ in items)
+                response = "\n".join(r for _, r in items)
+                _do_update(user_id, prompt, response)
+        except Exception as e:
+            print(f"ERROR in summary worker for user {user_id}: {e}")
+            traceback.print_exc()
+        finally:
+            _SUMMARY_QUEUE.task_done()
+
+
+def _regex_extract(prompt):
+    """Pull name, work and likes out of a prompt with the fixed patterns"""
+    update_data = {"personal_info": {}, "preferences": {}, "important_topics": [], "changes_made": []}
+    prompt_lower = prompt.lower()
+    name_match = _NAME_RE.search(prompt_lower)
+    if name_match:
+        update_data["personal_info"]["nombre"] = name_match.group(1).strip().title()
+        update_data["changes_made"].append(f"Nombre identificado: {name_match.group(1).strip().title()}")
+    work_match = _WORK_RE.search(prompt_lower)
+    if work_match and 'nombre' not in work_match.group(1).lower():
+        update_data["personal_info"]["trabajo"] = work_match.group(1).strip()
+        update_data["changes_made"].append(f"Trabajo identificado: {work_match.group(1).strip()}")
+    like_match = _LIKE_RE.search(prompt_lower)
+    if like_match:
+        update_data["preferences"]["le_gusta"] = like_match.group(1).strip()
+        update_data["changes_made"].append(f"Preferencia identificada: {like_match.group(1).strip()}")
+    return update_data
+
+
+def _do_update(user_id, prompt, response):
+    """Analyze conversation and update stored summary"""
     summary = load_user_summary(user_id)
     print(f"[{user_id}] Summary update triggered - processing...")
 
@@ -170,39 +313,34 @@ Extrae SOLO información nueva e importante sobre:
 Responde en formato JSON simple:
 {{"personal_info": {{"nombre": "valor", "trabajo": "valor"}}, "preferences": {{"le_gusta": "valor"}}, "important_topics": ["tema"], "changes_made": ["cambio realizado"]}}"""
     try:
-        print(f"[{user_id}] Calling AI for summary extraction...")
-        ai_response = ollama.generate(model=MODEL_NAME, prompt=update_prompt)['response']
-        print(f"[{user_id}] AI Response for summary: {ai_response[:200]}...")
-
         update_data = None
-        patterns = [r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', r'\{.*?\}']
-        for pattern in patterns:
-            matches = re.findall(pattern, ai_response, re.DOTALL)
-            for match in matches:
+        if len(prompt.split()) < REGEX_ONLY_MAX_WORDS:
+            regex_data = _regex_extract(prompt)
+            if regex_data["personal_info"] or regex_data["preferences"]:
+                print(f"[{user_id}] Short prompt matched directly, skipping AI extraction")
+                update_data = regex_data
+
+        if update_data is None:
+            print(f"[{user_id}] Calling AI for summary extraction...")
+            ai_response = get_ollama().generate(
+                model=MODEL_NAME,
+                prompt=update_prompt,
+                options={"num_predict": SUMMARY_MAX_TOKENS, "temperature": 0}
+            )['response']
+            print(f"[{user_id}] AI Response for summary: {ai_response[:200]}...")
+
+            for candidate in _iter_json_candidates(ai_response):
                 try:
-                    update_data = json.loads(match.strip())
-                    print(f"[{user_id}] JSON parsed successfully with pattern")
-                    break
-                except json.JSONDecodeError:
+                    update_data = loads(candidate)
+                except JSONDecodeError:
                     continue
-            if update_data:
-                break
+                if update_data:
+                    print(f"[{user_id}] JSON parsed successfully")
+                    break
 
         if not update_data:
             print(f"[{user_id}] JSON parsing failed, attempting manual extraction...")
-            update_data = {"personal_info": {}, "preferences": {}, "important_topics": [], "changes_made": []}
-            name_match = re.search(r'(?:mi nombre es|me llamo|soy)\s+([a-zA-ZáéíóúÁÉÍÓÚñÑ\s]+)', prompt.lower())
-            if name_match:
-                update_data["personal_info"]["nombre"] = name_match.group(1).strip().title()
-                update_data["changes_made"].append(f"Nombre identificado: {name_match.group(1).strip().title()}")
-            work_match = re.search(r'(?:trabajo en|soy|mi trabajo es)\s+([a-zA-ZáéíóúÁÉÍÓÚñÑ\s]+)', prompt.lower())
-            if work_match and 'nombre' not in work_match.group(1).lower():
-                update_data["personal_info"]["trabajo"] = work_match.group(1).strip()
-                update_data["changes_made"].append(f"Trabajo identificado: {work_match.group(1).strip()}")
-            like_match = re.search(r'(?:me gusta|prefiero|amo)\s+([a-zA-ZáéíóúÁÉÍÓÚñÑ\s]+)', prompt.lower())
-            if like_match:
-                update_data["preferences"]["le_gusta"] = like_match.group(1).strip()
-                update_data["changes_made"].append(f"Preferencia identificada: {like_match.group(1).strip()}")
+            update_data = _regex_extract(prompt)
 
         if update_data:
             changes_made = False
@@ -221,11 +359,8 @@ Responde en formato JSON simple:
                         summary['preferences'][key] = f"{existing}, {incoming}" if existing else incoming
                         changes_made = True
             if update_data.get('important_topics'):
-                for topic in update_data['important_topics']:
-                    if topic and topic.strip() and topic not in summary['important_topics']:
-                        summary['important_topics'].append(topic.strip())
-                        changes_made = True
-            summary['important_topics'] = summary['important_topics'][-10:]
+                if _add_topics(summary['important_topics'], update_data['important_topics']):
+                    changes_made = True
             if changes_made:
                 save_user_summary(user_id, summary)
                 changes = update_data.get('changes_made', ['Información actualizada'])
@@ -253,3 +388,6 @@ def get_summary_text(user_id):
         topics_text = ", ".join(summary['important_topics'])
         parts.append(f"Temas importantes: {topics_text}")
     return ". ".join(parts) if parts else "No hay información de resumen disponible."
+
+
+threading.Thread(target=_summary_worker, daemon=True, name="summary-worker").start()
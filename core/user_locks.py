@@ -0,0 +1,84 @@
+# ===============================================================
+#  File: user_locks.py
+#  Description: Per-user "reply in progress" locks with expiry
+#
+#  Author: ac.craft8
+#  Created: 2025-06-24
+#  License: MIT
+# ===============================================================
+
+# ================================
+#  Module and Library Imports
+# ================================
+import heapq
+import threading
+import time
+
+try:
+    from fastrlock.rlock import FastRLock as _ShardLock
+except ImportError:
+    _ShardLock = threading.Lock
+
+# ================================
+#  Class Definitions
+# ================================
+
+class ShardedLockRegistry:
+    """Per-user busy flags with an expiry time, spread over independently
+    guarded shards so concurrent users rarely contend on the same lock"""
+
+    __slots__ = ('_shards', '_mask', '_expiry_heap', '_heap_lock')
+
+    def __init__(self, shard_count=32):
+        # shard_count must be a power of two for the mask lookup
+        self._shards = [(_ShardLock(), {}) for _ in range(shard_count)]
+        self._mask = shard_count - 1
+        # (expiry, user_id) entries; an entry is live only while it still
+        # matches the user's stored expiry, so releases need no heap work
+        self._expiry_heap = []
+        self._heap_lock = threading.Lock()
+
+    def _shard(self, user_id):
+        return self._shards[hash(user_id) & self._mask]
+
+    def try_acquire(self, user_id, timeout):
+        """Mark user busy for up to timeout seconds; False if already busy"""
+        guard, expiries = self._shard(user_id)
+        now = time.monotonic()
+        with guard:
+            expiry = expiries.get(user_id)
+            if expiry is not None and expiry > now:
+                return False
+            expiries[user_id] = new_expiry = now + timeout
+        with self._heap_lock:
+            heapq.heappush(self._expiry_heap, (new_expiry, user_id))
+        if expiry is not None:
+            print(f"[Telegram] Lock timeout for user {user_id}. Resetting lock.")
+        return True
+
+    def release(self, user_id):
+        """Clear the user's busy flag"""
+        guard, expiries = self._shard(user_id)
+        with guard:
+            expiries.pop(user_id, None)
+
+    def is_locked(self, user_id):
+        """Return True while the user holds an unexpired lock"""
+        guard, expiries = self._shard(user_id)
+        expiry = expiries.get(user_id)
+        return expiry is not None and expiry > time.monotonic()
+
+    def sweep(self):
+        """Drop expired entries and return the affected user IDs"""
+        now = time.monotonic()
+        expired = []
+        with self._heap_lock:
+            heap = self._expiry_heap
+            while heap and heap[0][0] <= now:
+                expiry, user_id = heapq.heappop(heap)
+                guard, expiries = self._shard(user_id)
+                with guard:
+                    if expiries.get(user_id) == expiry:
+                        del expiries[user_id]
+                        expired.append(user_id)
+        return expired
@@ -0,0 +1,222 @@
+# ===============================================================
+#  File: user_state.py
+#  Description: In-process cache of per-user logs and summaries
+#               with debounced write-through to disk
+#
+#  Author: ac.craft8
+#  Created: 2025-06-24
+#  License: MIT
+# ===============================================================
+
+# ================================
+#  Module and Library Imports
+# ================================
+import atexit
+import collections
+import heapq
+import os
+import threading
+import time
+
+from core.io_utils import append_jsonl, atomic_write_json, atomic_write_jsonl, loads, read_json
+from settings import Logs
+
+# ================================
+#  Configuration and State
+# ================================
+FLUSH_DELAY_SECONDS = 2
+RECENT_LOGS = int(Logs)
+TAIL_BLOCK_SIZE = 4096
+
+_logs = {}
+_pending_logs = {}
+_summaries = {}
+_dirty_summaries = set()
+_user_locks = {}
+_user_locks_guard = threading.Lock()
+_ensured_dirs = set()
+
+# One flusher thread serves every debounced write: (deadline, user_id)
+# heap entries are live only while they match _flush_deadlines
+_flush_deadlines = {}
+_flush_heap = []
+_flush_cv = threading.Condition()
+
+# ================================
+#  Function Definitions
+# ================================
+
+def _get_lock(user_id):
+    """Return the lock guarding a user's cached state"""
+    with _user_locks_guard:
+        lock = _user_locks.get(user_id)
+        if lock is None:
+            lock = _user_locks[user_id] = threading.Lock()
+        return lock
+
+
+def _user_file(user_id, name):
+    """Return path to a file inside the user's log folder"""
+    return os.path.join('logs', str(user_id), name)
+
+
+def ensure_user_dir(user_id):
+    """Create the user's log folder once per process and return it"""
+    user_dir = os.path.join('logs', str(user_id))
+    if user_id not in _ensured_dirs:
+        os.makedirs(user_dir, exist_ok=True)
+        _ensured_dirs.add(user_id)
+    return user_dir
+
+
+def _read_json(path, default):
+    """Read a JSON file, returning default if missing or unreadable"""
+    try:
+        return read_json(path)
+    except FileNotFoundError:
+        return default
+    except Exception as e:
+        print(f"ERROR reading {path}: {e}")
+        return default
+
+
+def _write_json(user_id, name, data):
+    """Atomically write data as compact JSON into the user's folder"""
+    atomic_write_json(os.path.join(ensure_user_dir(user_id), name), data)
+
+
+def _read_tail(path, count):
+    """Return the last count entries of a JSONL file without reading all of it"""
+    with open(path, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        data = b''
+        while pos > 0 and data.count(b'\n') <= count:
+            step = min(TAIL_BLOCK_SIZE, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    entries = []
+    for line in data.splitlines()[-count:]:
+        try:
+            entries.append(loads(line))
+        except ValueError:
+            continue
+    return entries
+
+
+def _migrate_json_log(user_id):
+    """Convert a legacy user.json array into user.jsonl (one-shot)"""
+    old_path = _user_file(user_id, 'user.json')
+    new_path = _user_file(user_id, 'user.jsonl')
+    try:
+        entries = read_json(old_path)
+    except FileNotFoundError:
+        return False
+    # Entries are stripped when logged; legacy ones must match
+    for entry in entries:
+        for field in ('message', 'response'):
+            if isinstance(entry.get(field), str):
+                entry[field] = entry[field].strip()
+    atomic_write_jsonl(new_path, entries)
+    # user.jsonl is fsynced and in place; only now drop the legacy copy
+    os.remove(old_path)
+    print(f"[{user_id}] Migrated user.json to user.jsonl ({len(entries)} entries).")
+    return True
+
+
+def _load_logs(user_id):
+    """Return cached recent logs, loading the file tail on first access"""
+    logs = _logs.get(user_id)
+    if logs is None:
+        logs = _logs[user_id] = collections.deque(maxlen=RECENT_LOGS)
+        path = _user_file(user_id, 'user.jsonl')
+        try:
+            try:
+                logs.extend(_read_tail(path, RECENT_LOGS))
+            except FileNotFoundError:
+                if _migrate_json_log(user_id):
+                    logs.extend(_read_tail(path, RECENT_LOGS))
+        except Exception as e:
+            print(f"ERROR reading {path}: {e}")
+    return logs
+
+
+def get_logs(user_id):
+    """Return the user's most recent interactions (up to settings.Logs)"""
+    with _get_lock(user_id):
+        return list(_load_logs(user_id))
+
+
+def append_log(user_id, entry):
+    """Append an interaction and schedule a flush to disk"""
+    with _get_lock(user_id):
+        _load_logs(user_id).append(entry)
+        _pending_logs.setdefault(user_id, []).append(entry)
+    _schedule_flush(user_id)
+
+
+def get_summary(user_id):
+    """Return the user's stored summary, or None if there is none yet"""
+    with _get_lock(user_id):
+        if user_id not in _summaries:
+            _summaries[user_id] = _read_json(_user_file(user_id, 'summary.json'), None)
+        return _summaries[user_id]
+
+
+def set_summary(user_id, summary):
+    """Replace the user's summary and schedule a flush to disk"""
+    with _get_lock(user_id):
+        _summaries[user_id] = summary
+        _dirty_summaries.add(user_id)
+    _schedule_flush(user_id)
+
+
+def _schedule_flush(user_id):
+    """Schedule or reschedule a debounced flush for the user"""
+    deadline = time.monotonic() + FLUSH_DELAY_SECONDS
+    with _flush_cv:
+        _flush_deadlines[user_id] = deadline
+        heapq.heappush(_flush_heap, (deadline, user_id))
+        _flush_cv.notify()
+
+
+def _flush_scheduler():
+    """Flush users as their debounce deadlines expire"""
+    while True:
+        with _flush_cv:
+            while True:
+                now = time.monotonic()
+                if _flush_heap and _flush_heap[0][0] <= now:
+                    deadline, user_id = heapq.heappop(_flush_heap)
+                    # Skip entries superseded by a newer write
+                    if _flush_deadlines.get(user_id) == deadline:
+                        break
+                    continue
+                _flush_cv.wait(_flush_heap[0][0] - now if _flush_heap else None)
+        flush_user(user_id)
+
+
+def flush_user(user_id):
+    """Write any pending logs or summary for the user to disk"""
+    with _flush_cv:
+        _flush_deadlines.pop(user_id, None)
+    with _get_lock(user_id):
+        try:
+            pending = _pending_logs.pop(user_id, None)
+            if pending:
+                append_jsonl(os.path.join(ensure_user_dir(user_id), 'user.jsonl'), pending)
+            if user_id in _dirty_summaries:
+                _write_json(user_id, 'summary.json', _summaries[user_id])
+                _dirty_summaries.discard(user_id)
+        except Exception as e:
+            print(f"ERROR flushing state for user {user_id}: {e}")
+
+
+def flush_all():
+    """Flush every user with pending changes"""
+    for user_id in list(_pending_logs.keys() | _dirty_summaries):
+        flush_user(user_id)
+
+
+threading.Thread(target=_flush_scheduler, daemon=True, name="state-flusher").start()
+atexit.register(flush_all)
@@ -10,14 +10,9 @@
 # ================================
 #  Module and Library Imports
 # ================================
-from config_loader import load_whitelist
-from memory_manager import load_chroma_client, get_user_memory
-
-# ================================
-#  Configuration
-# ================================
-client = load_chroma_client()
-WHITELIST, USER_WHITELIST = load_whitelist()
+from config_loader import CHROMA_CLIENT, MODEL_NAME, is_authorized, reload_whitelist
+from memory_manager import get_user_memory, rebuild_backup
+from messages import unauthorized_command_message
 
 # ================================
 #  Function Definitions
@@ -26,14 +21,15 @@ WHITELIST, USER_WHITELIST = load_whitelist()
 def reload_command(update, context):
     """Handle reload command"""
     user_id = update.effective_user.id
-    if WHITELIST and user_id not in USER_WHITELIST:
-        update.message.reply_text("No tienes autorización para usar este comando.")
+    if not is_authorized(user_id):
+        update.message.reply_text(unauthorized_command_message)
         return
-    memory = get_user_memory(user_id, client)
+    reload_whitelist()
+    memory = get_user_memory(user_id, CHROMA_CLIENT)
     try:
-        if not memory.get()["documents"]:
+        if not rebuild_backup(memory, MODEL_NAME, user_id):
             update.message.reply_text("No hay nada que persistir: la memoria está vacía.")
         else:
-            update.message.reply_text("Comando reload recibido. Backup ya guardado en JSON - no se necesita persistencia adicional.")
+            update.message.reply_text("Comando reload recibido. Backup JSONL regenerado desde la memoria.")
     except Exception as e:
         update.message.reply_text(f"Error durante reload: {str(e)}")
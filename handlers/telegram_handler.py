@@ -10,100 +10,142 @@
 # ================================
 #  Module and Library Imports
 # ================================
+import heapq
 import threading
+from concurrent.futures import ThreadPoolExecutor
+import time
 import logging
 import traceback
 from telegram import ParseMode
 
-from config_loader import load_whitelist
+from config_loader import is_authorized
 from core.ai_engine import generate_response
-from messages import processing_lock_message
+from core.user_locks import ShardedLockRegistry
+from messages import processing_lock_message, thinking_message, unauthorized_message
 
 # ================================
 #  Configuration and State
 # ================================
 LOCK_TIMEOUT_SECONDS = 1000
 DEBOUNCE_DELAY_SECONDS = 5
+REPLY_WORKERS = 32
+MAX_MESSAGE_LENGTH = 4096
 
-locks = {}
-lock_timeouts = {}
-user_timers = {}
+user_locks = ShardedLockRegistry()
 user_pending_messages = {}
+user_updates = {}
+user_deadlines = {}
 
-WHITELIST, USER_WHITELIST = load_whitelist()
+# One scheduler thread serves every debounce deadline
+_scheduler_heap = []
+_scheduler_cv = threading.Condition()
+
+# Replies run on a fixed pool instead of a fresh thread per prompt
+_reply_executor = ThreadPoolExecutor(max_workers=REPLY_WORKERS, thread_name_prefix="reply")
 
 # ================================
 #  Function Definitions
 # ================================
 
-def reset_lock(user_id):
-    """Reset user lock after timeout"""
-    if locks.get(user_id):
-        print(f"[Telegram] Lock timeout for user {user_id}. Resetting lock.")
-        locks[user_id] = False
-
-
 def process_debounced_messages(user_id, update):
     """Process accumulated messages after debounce delay"""
-    if user_id in user_pending_messages:
-        messages = user_pending_messages[user_id]
+    with _scheduler_cv:
+        messages = user_pending_messages.pop(user_id, None)
+    if messages:
         combined_prompt = "\n".join(messages)
-        del user_pending_messages[user_id]
         process_user_message(user_id, combined_prompt, update)
 
 
 def schedule_debounced_response(user_id, message, update):
     """Schedule or reschedule debounced response"""
-    if user_id in user_timers:
-        user_timers[user_id].cancel()
-    if user_id not in user_pending_messages:
-        user_pending_messages[user_id] = []
-    user_pending_messages[user_id].append(message)
-    timer = threading.Timer(DEBOUNCE_DELAY_SECONDS, process_debounced_messages, args=(user_id, update))
-    user_timers[user_id] = timer
-    timer.start()
+    deadline = time.monotonic() + DEBOUNCE_DELAY_SECONDS
+    with _scheduler_cv:
+        user_pending_messages.setdefault(user_id, []).append(message)
+        user_updates[user_id] = update
+        user_deadlines[user_id] = deadline
+        heapq.heappush(_scheduler_heap, (deadline, user_id))
+        _scheduler_cv.notify()
     print(f"[{user_id}] Message queued. Debounce timer set for {DEBOUNCE_DELAY_SECONDS} seconds.")
 
 
-def process_user_message(user_id, prompt, update):
-    """Process user message and generate response"""
-    if locks.get(user_id, False):
-        return
-
-    def reply():
+def _debounce_scheduler():
+    """Fire debounced responses as their deadlines expire"""
+    while True:
+        with _scheduler_cv:
+            while True:
+                now = time.monotonic()
+                if _scheduler_heap and _scheduler_heap[0][0] <= now:
+                    deadline, user_id = heapq.heappop(_scheduler_heap)
+                    # Skip entries superseded by a newer message
+                    if user_deadlines.get(user_id) == deadline:
+                        del user_deadlines[user_id]
+                        update = user_updates.pop(user_id)
+                        break
+                    continue
+                _scheduler_cv.wait(_scheduler_heap[0][0] - now if _scheduler_heap else None)
         try:
-            locks[user_id] = True
-            lock_timeouts[user_id] = threading.Timer(LOCK_TIMEOUT_SECONDS, reset_lock, args=(user_id,))
-            lock_timeouts[user_id].start()
-            print(f"[{user_id}] Processing prompt: {prompt[:100]}...")
-            update.message.reply_text("Pensando...", parse_mode=ParseMode.MARKDOWN)
-            response = generate_response(user_id, prompt)
-            MAX_MESSAGE_LENGTH = 4096
-            for i in range(0, len(response), MAX_MESSAGE_LENGTH):
-                chunk = response[i:i+MAX_MESSAGE_LENGTH]
-                update.message.reply_text(chunk, parse_mode=None)
-            logging.info(f"User {user_id}: {prompt}")
-            print(f"[{user_id}] Response sent.")
+            process_debounced_messages(user_id, update)
         except Exception as e:
-            update.message.reply_text(f"Error al procesar el mensaje: {str(e)}")
-            print(f"[{user_id}] ERROR in reply thread: {e}")
+            print(f"[{user_id}] ERROR processing debounced messages: {e}")
             traceback.print_exc()
-        finally:
-            if lock_timeouts.get(user_id):
-                lock_timeouts[user_id].cancel()
-            locks[user_id] = False
+        for expired_id in user_locks.sweep():
+            print(f"[Telegram] Lock timeout for user {expired_id}. Resetting lock.")
+
+
+def split_message(text, limit=MAX_MESSAGE_LENGTH):
+    """Yield Telegram-sized chunks, breaking at the last newline when possible"""
+    start, length = 0, len(text)
+    while length - start > limit:
+        end = text.rfind("\n", start, start + limit)
+        if end <= start:
+            end = start + limit
+        yield text[start:end]
+        start = end + 1 if text[end] == "\n" else end
+    if start < length:
+        yield text[start:]
+
+
+def _reply(user_id, prompt, update):
+    """Generate the response and send it, then release the user's lock"""
+    try:
+        print(f"[{user_id}] Processing prompt: {prompt[:100]}...")
+        update.message.reply_text(thinking_message, parse_mode=ParseMode.MARKDOWN)
+        response = generate_response(user_id, prompt)
+        for chunk in split_message(response):
+            update.message.reply_text(chunk, parse_mode=None)
+        logging.info("User %s: %s", user_id, prompt)
+        print(f"[{user_id}] Response sent.")
+    except Exception as e:
+        update.message.reply_text(f"Error al procesar el mensaje: {str(e)}")
+        print(f"[{user_id}] ERROR in reply thread: {e}")
+        traceback.print_exc()
+    finally:
+        user_locks.release(user_id)
 
-    threading.Thread(target=reply, daemon=True).start()
+
+def process_user_message(user_id, prompt, update):
+    """Process user message and generate response"""
+    if not user_locks.try_acquire(user_id, LOCK_TIMEOUT_SECONDS):
+        return
+    try:
+        _reply_executor.submit(_reply, user_id, prompt, update)
+    except RuntimeError as e:
+        # Executor already shut down (interpreter exiting)
+        user_locks.release(user_id)
+        print(f"[{user_id}] ERROR scheduling reply: {e}")
 
 
 def handle_message(update, context):
     """Handle incoming Telegram messages"""
     user_id = update.effective_user.id
     message = update.message.text.strip()
-    if WHITELIST and user_id not in USER_WHITELIST:
-        update.message.reply_text("No tienes autorización para usar este asistente.")
+    if not is_authorized(user_id):
+        update.message.reply_text(unauthorized_message)
         return
-    if locks.get(user_id, False):
+    if user_locks.is_locked(user_id):
         update.message.reply_text(processing_lock_message)
         return
     schedule_debounced_response(user_id, message, update)
+
+
+threading.Thread(target=_debounce_scheduler, daemon=True, name="debounce-scheduler").start()
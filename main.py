@@ -10,26 +10,36 @@
 # ================================
 #  Module and Library Imports
 # ================================
+import signal
 import traceback
 from telegram.ext import CommandHandler, Filters, MessageHandler, Updater
 
-from config_loader import load_model_from_settings, load_telegram_token, load_whitelist
+from config_loader import MODEL_NAME, WHITELIST, USER_WHITELIST, load_telegram_token, reload_whitelist
 from core.logger import setup_logging
 from handlers.telegram_handler import handle_message
 from handlers.command_handler import reload_command
 from core.ai_engine import MAX_RESPONSE_LENGTH
 from handlers.telegram_handler import DEBOUNCE_DELAY_SECONDS
 
+# ================================
+#  Configuration
+# ================================
+# Long-poll getUpdates: Telegram holds each request open until an update arrives
+POLL_TIMEOUT_SECONDS = 20
 
 # ================================
 #  Main Orchestration
 # ================================
 
+def reload_config(signum=None, frame=None):
+    """Re-read whitelist.txt on SIGHUP (prompt.txt is reloaded by mtime)"""
+    users = reload_whitelist()
+    print(f"[Config] Reloaded whitelist: {len(users)} authorized users.")
+
+
 def main():
     """Start the Telegram bot and register handlers"""
-    model_name = load_model_from_settings()
     token = load_telegram_token()
-    whitelist, user_whitelist = load_whitelist()
     setup_logging()
 
     if not token:
@@ -37,21 +47,25 @@ def main():
         return
 
     print("=== Telegram Assistant Bot Starting ===")
-    print(f"Model: {model_name}")
-    print(f"Whitelist enabled: {whitelist}")
-    if whitelist:
-        print(f"Authorized users: {user_whitelist}")
+    print(f"Model: {MODEL_NAME}")
+    print(f"Whitelist enabled: {WHITELIST}")
+    if WHITELIST:
+        print(f"Authorized users: {set(USER_WHITELIST)}")
     print(f"Max response length: {MAX_RESPONSE_LENGTH} characters")
     print(f"Debounce delay: {DEBOUNCE_DELAY_SECONDS} seconds")
     print("Summary system: ENABLED")
 
+    # Updater.idle() only traps SIGINT/SIGTERM/SIGABRT; SIGHUP is free
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, reload_config)
+
     try:
         updater = Updater(token=token, use_context=True)
         dp = updater.dispatcher
         dp.add_handler(MessageHandler(Filters.text & ~Filters.command, handle_message))
         dp.add_handler(CommandHandler("reload", reload_command))
         print("Bot handlers configured. Starting polling...")
-        updater.start_polling()
+        updater.start_polling(poll_interval=0.0, timeout=POLL_TIMEOUT_SECONDS)
         print("Bot is running. Press Ctrl+C to stop.")
         updater.idle()
     except Exception as e:
@@ -13,44 +13,76 @@
 # ================================
 #  Module and Library Imports
 # ================================
+import functools
+import itertools
 import os
 import time
-import json
 import re
-import chromadb
-from settings import enable_memory
+import queue
+import atexit
+import threading
+
+from core.io_utils import append_jsonl, atomic_write_jsonl
 
 # ================================
-#  Memory Management Functions
+#  Batching Configuration
 # ================================
+CHROMA_BATCH_SIZE = 250
+CHROMA_FLUSH_INTERVAL_SECONDS = 0.5
+# Longest shutdown waits for queued interactions before giving up
+CHROMA_EXIT_TIMEOUT_SECONDS = 10
 
-def load_chroma_client():
-    """Initialize ChromaDB client if memory is enabled"""
-    if enable_memory:
-        try:
-            client = chromadb.Client(
-                settings=chromadb.config.Settings(
-                    persist_directory="./chroma_memoria"
-                )
-            )
-            print("[Memory] ChromaDB memory system ENABLED.")
-            return client
-        except Exception as e:
-            print(f"[Memory] ERROR initializing ChromaDB: {e}")
-            return None
-    else:
-        print("[Memory] ChromaDB memory system DISABLED in settings.py.")
-        return None
+# Interactions waiting to be added to ChromaDB by the flusher thread
+_chroma_queue = queue.Queue(maxsize=10_000)
+
+_CODE_BLOCK_RE = re.compile(r"```python\n(.*?)```", re.DOTALL)
+
+# HNSW parameters applied when a user's collection is first created
+COLLECTION_METADATA = {
+    "hnsw:construction_ef": 100,
+    "hnsw:M": 16,
+    "hnsw:search_ef": 64
+}
+
+# Collection handles by user, so Chroma's metadata store is hit once per user
+_collections = {}
+_collections_lock = threading.Lock()
 
+# Per-backup-file locks: a rebuild snapshot and the flusher's add+append
+# must not interleave, or rows stored in between drop out of the backup
+_backup_locks = {}
+_backup_locks_guard = threading.Lock()
+
+# Code-extraction folders already created by this process
+_code_dirs = set()
+
+# Document ids: pid + nanosecond clock + counter, unique even within one tick
+_PID = os.getpid()
+_ID_COUNTER = itertools.count()
+
+# ================================
+#  Memory Management Functions
+# ================================
+
+@functools.lru_cache(maxsize=4096)
 def get_memory_key(user_id):
     """Generate memory key for user"""
     return f"user_{user_id}"
 
 def get_user_memory(user_id, client):
-    """Get or create user memory collection if enabled"""
+    """Get or create user memory collection if enabled (cached per user)"""
     if not client:
         return None
-    return client.get_or_create_collection(name=get_memory_key(user_id))
+    memory = _collections.get(user_id)
+    if memory is None:
+        with _collections_lock:
+            memory = _collections.get(user_id)
+            if memory is None:
+                memory = _collections[user_id] = client.get_or_create_collection(
+                    name=get_memory_key(user_id),
+                    metadata=COLLECTION_METADATA
+                )
+    return memory
 
 def query_memory(memory, prompt):
     """Query user memory for relevant context"""
@@ -58,8 +90,9 @@ def query_memory(memory, prompt):
         return "Memory is disabled."
     try:
         result = memory.query(query_texts=[prompt], n_results=5, include=['documents'])
-        documents = [doc for sublist in result['documents'] for doc in sublist if doc.strip()]
-        return "\n---\n".join(documents[:5]) if documents else "No relevant previous context found."
+        # One query text, so Chroma returns a single result list
+        documents = [doc for doc in result['documents'][0] if doc and not doc.isspace()]
+        return "\n---\n".join(documents) if documents else "No relevant previous context found."
     except Exception as e:
         print(f"ERROR querying memory: {e}")
         return "Memory query failed."
@@ -69,41 +102,165 @@ def get_last_interaction(memory):
     if not memory:
         return "Memory is disabled."
     try:
-        data = memory.get()
+        count = memory.count()
+        if not count:
+            return "No previous conversation history."
+        # Fetch only the newest row instead of the whole collection
+        data = memory.get(limit=1, offset=count - 1, include=["documents"])
         return data["documents"][-1] if data["documents"] else "No previous conversation history."
     except Exception as e:
         print(f"ERROR getting last interaction: {e}")
         return "Could not retrieve last interaction."
 
+@functools.lru_cache(maxsize=16)
+def _backup_dir(model_name):
+    """Return the backup folder for a model, creating it once per process"""
+    user_dir = f"./user_backups_{model_name.replace(':', '_').replace('.', '_')}"
+    os.makedirs(user_dir, exist_ok=True)
+    return user_dir
+
+@functools.lru_cache(maxsize=4096)
+def get_backup_path(model_name, user_id):
+    """Return path to the user's JSONL memory backup"""
+    return os.path.join(_backup_dir(model_name), f"{get_memory_key(user_id)}.jsonl")
+
+def _get_backup_lock(backup_file):
+    """Return the lock serializing writes to one backup file"""
+    with _backup_locks_guard:
+        lock = _backup_locks.get(backup_file)
+        if lock is None:
+            lock = _backup_locks[backup_file] = threading.Lock()
+        return lock
+
+def _write_snapshot(memory, backup_file):
+    """Write the full collection to backup_file; caller holds its lock"""
+    all_data = memory.get(include=["documents"])
+    atomic_write_jsonl(backup_file, (
+        {"id": id_, "text": doc} for id_, doc in zip(all_data['ids'], all_data['documents'])
+    ))
+    return len(all_data['ids'])
+
+def rebuild_backup(memory, model_name, user_id):
+    """Rewrite the user's backup from the full collection contents"""
+    backup_file = get_backup_path(model_name, user_id)
+    with _get_backup_lock(backup_file):
+        return _write_snapshot(memory, backup_file)
+
+def _append_backup(memory, backup_file, ids, documents):
+    """Append newly stored interactions to the backup; caller holds its lock"""
+    try:
+        append_jsonl(
+            backup_file,
+            ({"id": id_, "text": doc} for id_, doc in zip(ids, documents)),
+            create=False
+        )
+    except FileNotFoundError:
+        # First backup for this user: snapshot everything stored so far
+        _write_snapshot(memory, backup_file)
+
+def _add_batch(batch):
+    """Add queued interactions to ChromaDB, one add() per collection"""
+    groups = {}
+    for memory, doc_id, document, model_name, user_id, _ in batch:
+        group = groups.get(memory.name)
+        if group is None:
+            group = groups[memory.name] = (memory, [], [], model_name, user_id)
+        group[1].append(doc_id)
+        group[2].append(document)
+
+    for memory, ids, documents, model_name, user_id in groups.values():
+        backup_file = get_backup_path(model_name, user_id)
+        # Hold the backup lock across add and append so a concurrent
+        # rebuild sees either neither or both
+        with _get_backup_lock(backup_file):
+            try:
+                memory.add(documents=documents, ids=ids)
+            except Exception as e:
+                # Retry row by row so one bad entry does not drop the batch
+                print(f"ERROR storing batch in memory, retrying individually: {e}")
+                stored_ids, stored_documents = [], []
+                for doc_id, document in zip(ids, documents):
+                    try:
+                        memory.add(documents=[document], ids=[doc_id])
+                        stored_ids.append(doc_id)
+                        stored_documents.append(document)
+                    except Exception as e:
+                        print(f"ERROR storing in memory: {e}")
+                ids, documents = stored_ids, stored_documents
+            try:
+                _append_backup(memory, backup_file, ids, documents)
+            except Exception as e:
+                print(f"ERROR writing memory backup: {e}")
+
+def _chroma_flusher():
+    """Drain the queue in batches of up to CHROMA_BATCH_SIZE interactions"""
+    while True:
+        batch = [_chroma_queue.get()]
+        deadline = time.monotonic() + CHROMA_FLUSH_INTERVAL_SECONDS
+        while len(batch) < CHROMA_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_chroma_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            _add_batch(batch)
+            for _, doc_id, _, _, user_id, response in batch:
+                _extract_code_blocks(user_id, response, doc_id)
+        except Exception as e:
+            # Never let one bad batch kill the flusher thread
+            print(f"ERROR flushing memory batch: {e}")
+        finally:
+            for _ in batch:
+                _chroma_queue.task_done()
+
+def flush_memory(timeout=CHROMA_EXIT_TIMEOUT_SECONDS):
+    """Wait up to timeout seconds for queued interactions to be stored"""
+    deadline = time.monotonic() + timeout
+    while _chroma_queue.unfinished_tasks:
+        if time.monotonic() >= deadline:
+            print(f"[Memory] Gave up waiting for {_chroma_queue.unfinished_tasks} queued interactions.")
+            return False
+        time.sleep(0.05)
+    return True
+
+def _extract_code_blocks(user_id, response, doc_id):
+    """Save each ```python block of a response to its own file"""
+    try:
+        code_dir = None
+        for i, match in enumerate(_CODE_BLOCK_RE.finditer(response)):
+            if code_dir is None:
+                code_dir = os.path.join("./codigo_extraido", get_memory_key(user_id))
+                if code_dir not in _code_dirs:
+                    os.makedirs(code_dir, exist_ok=True)
+                    _code_dirs.add(code_dir)
+            filepath = os.path.join(code_dir, f"respuesta_{doc_id}_bloque{i + 1}.py")
+            # Encode once and hand the whole block to a single write
+            with open(filepath, "wb") as code_file:
+                code_file.write(match.group(1).strip().encode("utf-8"))
+    except Exception as e:
+        print(f"ERROR extracting code blocks: {e}")
+
 def store_in_memory(memory, prompt, response, model_name, user_id):
-    """Store interaction in memory and create backups"""
+    """Queue interaction for memory storage and code-block extraction"""
     if not memory:
         print("[Memory] Skipped storing interaction - memory is disabled.")
         return
     try:
-        memory.add(
-            documents=[f"User: {prompt}\nAssistant: {response}"],
-            ids=[str(time.time())]
-        )
-        user_dir = f"./user_backups_{model_name.replace(':', '_').replace('.', '_')}"
-        os.makedirs(user_dir, exist_ok=True)
-        backup_file = os.path.join(user_dir, f"{get_memory_key(user_id)}.json")
-
-        all_data = memory.get()
-        backup = [{"id": id_, "text": doc} for id_, doc in zip(all_data['ids'], all_data['documents'])]
-
-        with open(backup_file, 'w', encoding='utf-8') as f:
-            json.dump(backup, f, ensure_ascii=False, indent=2)
-
-        code_blocks = re.findall(r"```python\n(.*?)```", response, re.DOTALL)
-        if code_blocks:
-            code_dir = os.path.join("./codigo_extraido", get_memory_key(user_id))
-            os.makedirs(code_dir, exist_ok=True)
-
-            for i, block in enumerate(code_blocks):
-                filename = f"respuesta_{int(time.time())}_bloque{i + 1}.py"
-                filepath = os.path.join(code_dir, filename)
-                with open(filepath, "w", encoding="utf-8") as code_file:
-                    code_file.write(block.strip())
+        _chroma_queue.put_nowait((
+            memory,
+            f"{_PID}-{time.time_ns()}-{next(_ID_COUNTER)}",
+            f"User: {prompt}\nAssistant: {response}",
+            model_name,
+            user_id,
+            response
+        ))
+    except queue.Full:
+        print(f"[Memory] Queue full - dropped interaction for user {user_id}.")
     except Exception as e:
         print(f"ERROR storing in memory: {e}")
+
+threading.Thread(target=_chroma_flusher, daemon=True, name="chroma-flusher").start()
+atexit.register(flush_memory)
@@ -0,0 +1,16 @@
+# ===============================================================
+#  File: messages.py
+#  Description: User-facing reply strings for Blimsey
+#
+#  Author: ac.craft8
+#  Created: 2025-06-24
+#  License: MIT
+# ===============================================================
+
+# ================================
+#  Reply Strings
+# ================================
+processing_lock_message = "Todavía estoy procesando tu mensaje anterior. Espera un momento, por favor."
+thinking_message = "Pensando..."
+unauthorized_message = "No tienes autorización para usar este asistente."
+unauthorized_command_message = "No tienes autorización para usar este comando."